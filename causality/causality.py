@@ -3,9 +3,12 @@
 # Written by Ghali Omar Boutaib <ghaliomar@usf.edu>
 # SEES Lab, College of Engineering, University of South Florida
 
+import sys
+from array import array
+from collections.abc import Callable, Collection, Iterable, Iterator, Sequence
 from dataclasses import dataclass
 from enum import Enum
-from pprint import pprint
+from itertools import chain, pairwise
 
 
 class Direction(Enum):
@@ -20,7 +23,11 @@ class Position(Enum):
     INITIAL, INTERMEDIARY, FINAL = range(3)
 
 
-@dataclass
+# Direction strings used in causality.txt
+_DIRECTIONS: dict[str, Direction] = {"req": Direction.REQ, "resp": Direction.RESP}
+
+
+@dataclass(slots=True, frozen=True)
 class Message:
     """Defines a message."""
 
@@ -32,12 +39,29 @@ class Message:
     position: Position
 
 
-def causal(a: Message, b: Message) -> bool:
+@dataclass(slots=True, frozen=True)
+class SequenceSearch:
+    """Defines a causality graph prepared by prepare_search for searching message sequences up to a given depth. Messages are numbered by the rank of their id, so bitsets only grow with the number of messages, whatever their ids."""
+
+    max_depth: int
+    # Messages to start sequences from
+    initial_ids: list[int]
+    # Message id at each index, and index of each message id
+    ids: list[int]
+    indices: dict[int, int]
+    # Prebuilt build_successors of the graph
+    successors: list[int]
+    # Prebuilt build_reachable of the graph, reachable[0] being the bitset of FINAL messages
+    reachable: list[int]
+
+
+def causal(a: Message, b: Message, same_operation: bool = False) -> bool:
     """Determines if a message 'a' can cause a message 'b'
 
     Args:
         a (Message): Preceding message
         b (Message): Next message
+        same_operation (bool, optional): Also require both messages to have the same opcode. Defaults to False.
 
     Returns:
         bool: True if message 'a' can cause message 'b', False otherwise
@@ -52,23 +76,86 @@ def causal(a: Message, b: Message) -> bool:
         or (a.position == Position.FINAL)
         or (b.position == Position.INITIAL)
         or (a.id == b.id)
-        # Below case breaks if opcode is different throughout.
-        # Only uncomment in the specific situation where you need all possible sequences to only have one opcode.
-        # or (a.operation != b.operation)
+        # Breaks if opcode is different throughout: only use it in the specific situation
+        # where you need all possible sequences to only have one opcode.
+        or (same_operation and a.operation != b.operation)
     )
 
 
-def build_relationships(graph: dict[int, set[int]], library: dict[int, Message]):
+def make_causal(
+    library: dict[int, Message], same_operation: bool = False
+) -> Callable[[int, int], bool]:
+    """Specializes causal for a given library. Every test depending on a single message is evaluated once per message beforehand, leaving a predicate on message ids that only has to cross-check them.
+
+    Args:
+        library (dict[int, Message]): Given library linking ids to Message data
+        same_operation (bool, optional): Also require both messages to have the same opcode. Defaults to False.
+
+    Returns:
+        Callable[[int, int], bool]: Predicate telling if message id 'a' can cause message id 'b', same results as causal
+    """
+
+    origin: dict[int, str] = {}
+    destination: dict[int, str] = {}
+    operation: dict[int, str] = {}
+    is_req: dict[int, bool] = {}
+    is_resp: dict[int, bool] = {}
+    is_initial: dict[int, bool] = {}
+    is_final: dict[int, bool] = {}
+
+    for message_id, message in library.items():
+        origin[message_id] = message.origin
+        destination[message_id] = message.destination
+        operation[message_id] = message.operation
+        is_req[message_id] = message.direction == Direction.REQ
+        is_resp[message_id] = message.direction == Direction.RESP
+        is_initial[message_id] = message.position == Position.INITIAL
+        is_final[message_id] = message.position == Position.FINAL
+
+    def specialized_causal(a_id: int, b_id: int) -> bool:
+        # Same failures as causal, in the same order
+        return not (
+            (is_resp[a_id] and is_req[b_id])
+            or (destination[a_id] != origin[b_id])
+            or is_final[a_id]
+            or is_initial[b_id]
+            or (a_id == b_id)
+        )
+
+    if not same_operation:
+        return specialized_causal
+
+    def same_operation_causal(a_id: int, b_id: int) -> bool:
+        return specialized_causal(a_id, b_id) and operation[a_id] == operation[b_id]
+
+    return same_operation_causal
+
+
+def build_relationships(
+    graph: dict[int, set[int]],
+    library: dict[int, Message],
+    same_operation: bool = False,
+):
     """Builds all causal relationships in a given graph
 
     Args:
         graph (dict[int, set[int]]): Given graph
         library (dict[int, Message]): Given library linking ids to Message data
+        same_operation (bool, optional): Only relate messages with the same opcode, see causal. Defaults to False.
     """
 
+    causes = make_causal(library, same_operation)
+
+    # A message can only cause messages originating where it is headed,
+    # so candidates are bucketed by origin and the predicate is only evaluated within a bucket.
+    by_origin: dict[str, list[int]] = {}
+
+    for b_id in graph:
+        by_origin.setdefault(library[b_id].origin, []).append(b_id)
+
     for a_id in graph:
-        for b_id in graph:
-            if causal(library[a_id], library[b_id]):
+        for b_id in by_origin.get(library[a_id].destination, ()):
+            if causes(a_id, b_id):
                 graph[a_id].add(b_id)
 
 
@@ -85,86 +172,413 @@ def parse_direction(original: str) -> Direction:
         Direction: Resulting Direction object
     """
 
-    if original == "req":
-        return Direction.REQ
-    elif original == "resp":
-        return Direction.RESP
-    else:
+    try:
+        return _DIRECTIONS[original]
+    except KeyError:
         raise ValueError(
             "Invalid message direction provided. Expected either 'req' or 'resp'."
-        )
+        ) from None
 
 
 def recursive_build_sequences(
     starting_id: int,
-    accumulated: list[int],
+    path: list[int],
+    depth: int,
+    visited: set[int],
     sequence_destination: list[list[int]],
     max_depth: int,
-    graph: dict[int, set[int]],
+    graph: dict[int, Collection[int]],
     library: dict[int, Message],
 ):
-    """Recursively builds possible message sequences starting at a given message.
+    """Recursively builds possible message sequences starting at a given message. The current sequence is extended and shrunk in place in a single buffer, only finished sequences get copied.
 
     Args:
         starting_id (int): Id number of the starting message
-        accumulated (list[int]): A list/array holding the current accumulated message sequence
+        path (list[int]): A list/array of at least max_depth items holding the current accumulated message sequence in its first depth items
+        depth (int): Length of the current accumulated message sequence, 0 to start a new one
+        visited (set[int]): Ids of the messages in the current accumulated message sequence, empty to start a new one
         sequence_destination (list[list[int]]): Destination list/array for successfully build sequences
         max_depth (int): Maximum depth of a built sequence
-        graph (dict[int, set[int]]): Given graph
+        graph (dict[int, Collection[int]]): Given graph
         library (dict[int, Message]): Given library linking ids to Message data
     """
 
     # Rule out cyclic cases
-    if starting_id in accumulated:
+    if starting_id in visited:
         return
 
-    new_accumulation: list[int] = accumulated + [starting_id]
-
-    if len(new_accumulation) > max_depth:
+    if depth >= max_depth:
         return
 
+    path[depth] = starting_id
+    depth += 1
+
     if library[starting_id].position == Position.FINAL:
-        sequence_destination.append(new_accumulation)
+        sequence_destination.append(path[:depth])
         return
 
+    visited.add(starting_id)
+
     for next_id in graph[starting_id]:
         recursive_build_sequences(
-            next_id, new_accumulation, sequence_destination, max_depth, graph, library
+            next_id,
+            path,
+            depth,
+            visited,
+            sequence_destination,
+            max_depth,
+            graph,
+            library,
         )
 
+    visited.discard(starting_id)
+
+
+def build_successors(graph: dict[int, Collection[int]]) -> list[int]:
+    """Packs a graph into a list holding the neighbors of each message as a bitset. Messages are numbered by the rank of their id: item n is the bitset of the message with the nth smallest id, bit n is set if that message is a neighbor.
+
+    Args:
+        graph (dict[int, Collection[int]]): Given graph
+
+    Returns:
+        list[int]: Neighbor bitset of each message index
+    """
+
+    ids = sorted(graph)
+    indices = {message_id: index for index, message_id in enumerate(ids)}
+    successors: list[int] = []
+
+    for message_id in ids:
+        bits = 0
+
+        for neighbor_id in graph[message_id]:
+            bits |= 1 << indices[neighbor_id]
+
+        successors.append(bits)
+
+    return successors
+
+
+def build_final_distances(
+    graph: dict[int, Collection[int]], library: dict[int, Message]
+) -> dict[int, int]:
+    """Computes how many steps each message needs at least to reach a FINAL message. FINAL messages are at distance 0 and messages that can't reach any FINAL message are left out.
+
+    Args:
+        graph (dict[int, Collection[int]]): Given graph
+        library (dict[int, Message]): Given library linking ids to Message data
+
+    Returns:
+        dict[int, int]: Distance to the closest FINAL message of each message id
+    """
+
+    predecessors: dict[int, list[int]] = {message_id: [] for message_id in graph}
+
+    for message_id, neighbors in graph.items():
+        for neighbor_id in neighbors:
+            predecessors[neighbor_id].append(message_id)
+
+    distances: dict[int, int] = {
+        message_id: 0
+        for message_id in graph
+        if library[message_id].position == Position.FINAL
+    }
+
+    # Breadth-first search walking the graph backwards from all FINAL messages at once
+    frontier: list[int] = list(distances)
+    distance = 0
+
+    while frontier:
+        distance += 1
+        next_frontier: list[int] = []
+
+        for message_id in frontier:
+            for predecessor_id in predecessors[message_id]:
+                if predecessor_id not in distances:
+                    distances[predecessor_id] = distance
+                    next_frontier.append(predecessor_id)
+
+        frontier = next_frontier
+
+    return distances
+
+
+def build_reachable(
+    graph: dict[int, Collection[int]], distances: dict[int, int], max_steps: int
+) -> list[int]:
+    """Groups messages by how close they are to a FINAL message: item n is the bitset of the messages that can reach a FINAL message in at most n steps. Messages are numbered by the rank of their id, like in build_successors.
+
+    Args:
+        graph (dict[int, Collection[int]]): Given graph
+        distances (dict[int, int]): Prebuilt build_final_distances of the graph
+        max_steps (int): Number of items to build, i.e. 1 + the most steps considered
+
+    Returns:
+        list[int]: Bitset of the message indices within n steps of a FINAL message, for each n
+    """
+
+    reachable: list[int] = [0] * max_steps
+
+    for index, message_id in enumerate(sorted(graph)):
+        distance = distances.get(message_id, max_steps)
+
+        if distance < max_steps:
+            reachable[distance] |= 1 << index
+
+    for distance in range(1, max_steps):
+        reachable[distance] |= reachable[distance - 1]
+
+    return reachable
+
+
+def build_descendants(successors: list[int]) -> list[int]:
+    """Computes, for each message index, the bitset of every message reachable from it in any number of steps. A message is among its own descendants only if it sits on a cycle.
+
+    Args:
+        successors (list[int]): Prebuilt build_successors of the graph
+
+    Returns:
+        list[int]: Descendant bitset of each message index
+    """
+
+    size = len(successors)
+    descendants: list[int] = [0] * size
+
+    # Tarjan's strongly connected components, walked iteratively.
+    # A component is complete only once every component it leads to is,
+    # so its descendants are computed once from theirs, without ever revisiting a message.
+    order: list[int] = [-1] * size
+    lowlink: list[int] = [0] * size
+    pending: list[int] = []
+    on_pending = 0
+    counter = 0
+
+    for root in range(size):
+        if order[root] >= 0:
+            continue
+
+        order[root] = lowlink[root] = counter
+        counter += 1
+        pending.append(root)
+        on_pending |= 1 << root
+        # Message index and neighbors left to explore, for each message being explored
+        frames: list[list[int]] = [[root, successors[root]]]
+
+        while frames:
+            frame = frames[-1]
+            index, remaining = frame
+
+            if remaining:
+                lowest = remaining & -remaining
+                frame[1] = remaining ^ lowest
+                next_index = lowest.bit_length() - 1
+
+                if order[next_index] < 0:
+                    order[next_index] = lowlink[next_index] = counter
+                    counter += 1
+                    pending.append(next_index)
+                    on_pending |= lowest
+                    frames.append([next_index, successors[next_index]])
+                elif on_pending & lowest:
+                    lowlink[index] = min(lowlink[index], order[next_index])
+
+                continue
+
+            frames.pop()
+
+            if frames:
+                parent = frames[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[index])
+
+            if lowlink[index] != order[index]:
+                continue
+
+            # The message roots a component, made of it and everything pending above it
+            members = 0
+
+            while True:
+                member = pending.pop()
+                members |= 1 << member
+
+                if member == index:
+                    break
+
+            on_pending &= ~members
+
+            # The neighbors of the members already include the members themselves if the component is a cycle
+            reached = 0
+            bits = members
+
+            while bits:
+                lowest = bits & -bits
+                bits ^= lowest
+                reached |= successors[lowest.bit_length() - 1]
+
+            outside = reached & ~members
+
+            while outside:
+                lowest = outside & -outside
+                below = descendants[lowest.bit_length() - 1]
+                reached |= below
+                # Whatever is below is covered by the descendants just added
+                outside &= ~(below | lowest)
+
+            bits = members
+
+            while bits:
+                lowest = bits & -bits
+                bits ^= lowest
+                descendants[lowest.bit_length() - 1] = reached
+
+    return descendants
+
+
+def prepare_search(
+    library: dict[int, Message],
+    graph: dict[int, Collection[int]],
+    max_depth: int,
+    initial_ids: list[int] | None = None,
+) -> SequenceSearch:
+    """Builds everything needed to search message sequences up to a given depth, once for all starting messages.
+
+    Args:
+        library (dict[int, Message]): Message library
+        graph (dict[int, Collection[int]]): Prebuilt causality graph
+        max_depth (int): Maximum depth of any given sequence
+        initial_ids (list[int], optional): Precomputed find_initial_ids of the library. Computed if not provided.
+
+    Returns:
+        SequenceSearch: Prepared search
+    """
+
+    if initial_ids is None:
+        initial_ids = find_initial_ids(library)
+
+    ids = sorted(graph)
+    distances = build_final_distances(graph, library)
+
+    return SequenceSearch(
+        max_depth,
+        initial_ids,
+        ids,
+        {message_id: index for index, message_id in enumerate(ids)},
+        build_successors(graph),
+        # Always at least one item so that the FINAL messages are known
+        build_reachable(graph, distances, max(max_depth - 1, 1)),
+    )
+
+
+def walk_sequences(starting_id: int, search: SequenceSearch) -> Iterator[list[int]]:
+    """Lazily yields possible message sequences starting at a given message, one at a time, so that consumers don't need to hold all of them at once.
+
+    Args:
+        starting_id (int): Id number of the starting message
+        search (SequenceSearch): Prebuilt prepare_search of the graph
+
+    Yields:
+        list[int]: Each possible message sequence
+    """
+
+    max_depth = search.max_depth
+    ids = search.ids
+    successors = search.successors
+    # Neighbors that can't complete a sequence within the depth left are never explored
+    reachable = search.reachable
+    finals = reachable[0]
+
+    starting_index = search.indices[starting_id]
+    starting_bit = 1 << starting_index
+
+    if max_depth < 1:
+        return
+
+    if finals & starting_bit:
+        yield [starting_id]
+        return
+
+    if max_depth == 1:
+        return
+
+    # The current sequence lives in a single preallocated buffer of message ids, with the bit
+    # of each of its messages in another one and all of them in a bitset,
+    # so extending it doesn't allocate anything.
+    # The stack holds the neighbors of each message in the current sequence that are left to explore, as bitsets.
+    # Neighbors already in the sequence are masked out when pushed, which rules out cyclic cases.
+    path: list[int] = [0] * max_depth
+    path[0] = starting_id
+    path_bits: list[int] = [0] * max_depth
+    path_bits[0] = starting_bit
+    visited: int = starting_bit
+    stack: list[int] = [
+        successors[starting_index] & reachable[max_depth - 2] & ~visited
+    ]
+    depth = 1
+
+    # Hot loop: bind everything it looks up to locals once
+    push = stack.append
+    pop = stack.pop
+
+    while depth:
+        remaining = stack[-1]
+
+        if not remaining:
+            pop()
+            depth -= 1
+            visited ^= path_bits[depth]
+            continue
+
+        # Take the lowest index left
+        lowest = remaining & -remaining
+        stack[-1] = remaining ^ lowest
+        next_index = lowest.bit_length() - 1
+
+        path[depth] = ids[next_index]
+
+        if finals & lowest:
+            yield path[: depth + 1]
+        else:
+            # A non-FINAL message only got here if a following message still fits in the sequence
+            path_bits[depth] = lowest
+            visited |= lowest
+            push(successors[next_index] & reachable[max_depth - depth - 2] & ~visited)
+            depth += 1
+
 
 def build_sequences(
     starting_id: int,
     max_depth: int,
-    graph: dict[int, set[int]],
+    graph: dict[int, Collection[int]],
     library: dict[int, Message],
+    search: SequenceSearch | None = None,
 ) -> list[list[int]]:
-    """Simplifies the use of recursive_build_sequences and directly returns the value instead of relying on an external state variable
+    """Builds possible message sequences starting at a given message and directly returns them. Same results as recursive_build_sequences, but walks the graph iteratively.
+
+    Preparing the search walks the whole graph, which costs more than the search itself at small depths: callers looping over starting messages must build prepare_search(library, graph, max_depth) once and pass it to every call.
 
     Args:
         starting_id (int): Id number of the starting message
         max_depth (int): Maximum depth of the sequence
-        graph (dict[int, set[int]]): Given graph
+        graph (dict[int, Collection[int]]): Given graph
         library (dict[int, Message]): Given library linking ids to Message data
+        search (SequenceSearch, optional): Prebuilt prepare_search of the graph for the same max_depth. Built for this call only if not provided.
 
     Returns:
         list[list[int]]: All resulting possible message sequences
     """
 
-    dest = []
+    if search is None:
+        search = prepare_search(library, graph, max_depth, [starting_id])
 
-    recursive_build_sequences(starting_id, [], dest, max_depth, graph, library)
-
-    return dest
+    return list(walk_sequences(starting_id, search))
 
 
 def project_sequences(
-    sequences: list[list[int]], whitelist: set[int]
+    sequences: Iterable[Sequence[int]], whitelist: set[int]
 ) -> list[list[int]]:
     """Given generated message sequences, filters out/projects for a given whitelist of message ids. Conserves relative positioning in each message sequence and discards empty message sequences.
 
     Args:
-        sequences (list[list[int]]): Given sequences to project/filter
+        sequences (Iterable[Sequence[int]]): Given sequences to project/filter, e.g. a list of lists or unpack_sequences of packed sequences
         whitelist (set[int]): Whitelist of message ids to project for
 
     Returns:
@@ -172,115 +586,306 @@ def project_sequences(
     """
 
     new_sequences = []
+    # Tuple copies of the kept sequences, for constant time duplicate checks
+    seen: set[tuple[int, ...]] = set()
 
     for sequence in sequences:
-        new_sequence = []
+        new_sequence = [id for id in sequence if id in whitelist]
 
-        for id in sequence:
-            if id in whitelist:
-                new_sequence.append(id)
+        if len(new_sequence) > 1:
+            key = tuple(new_sequence)
 
-        if len(new_sequence) > 1 and not new_sequence in new_sequences:
-            new_sequences.append(new_sequence)
+            if key not in seen:
+                seen.add(key)
+                new_sequences.append(new_sequence)
 
     new_sequences.sort(key=len)
 
     return new_sequences
 
 
-def pair_filter(sequence: list[int], a: int, b: int) -> bool:
+def pair_filter(sequence: Sequence[int], a: int, b: int) -> bool:
     """Assesses if a given message sequence fulfills a pair requirement. i.e. if either or both messages from the specified pair exist in the sequence, they must be neighbors in the specified order.
 
     Args:
-        sequence (list[int]): Message sequence
+        sequence (Sequence[int]): Message sequence
         a (int): First message id of the pair
         b (int): Second message id of the pair
 
     Returns:
         bool: Logical test result
     """
-    if a in sequence and b in sequence:
-        return sequence.index(a) + 1 == sequence.index(b)
-    elif a in sequence or b in sequence:
-        return False
+
+    # Single pass recording where each message of the pair first appears
+    a_index = b_index = -1
+
+    for index, id in enumerate(sequence):
+        if id == a:
+            if a_index < 0:
+                a_index = index
+        elif id == b and b_index < 0:
+            b_index = index
+
+    if a_index >= 0 and b_index >= 0:
+        return a_index + 1 == b_index
     else:
-        return True
+        return a_index < 0 and b_index < 0
 
 
 def build_graph(
     graph_file: str = "causality.txt",
-) -> tuple[dict[int, Message], dict[int, set[int]]]:
-    """Parses a given causality graph txt file into a library and a graph with no relationships. Run build_relationships on the graph to build the relationships between the nodes.
+    same_operation: bool = False,
+) -> tuple[dict[int, Message], dict[int, tuple[int, ...]]]:
+    """Parses a given causality graph txt file into a library and a graph holding the causal relationships between the messages.
 
     Args:
         graph_file (str, optional): Name of the causality graph txt file. Defaults to "causality.txt".
+        same_operation (bool, optional): Only relate messages with the same opcode, see causal. Defaults to False.
 
     Returns:
-        tuple[dict[int, Message], dict[int, set[int]]]: library, graph
+        tuple[dict[int, Message], dict[int, tuple[int, ...]]]: library, graph. The neighbors of each message are in ascending id order
     """
 
     library: dict[int, Message] = {}
 
+    section_positions: list[Position] = [
+        Position.INITIAL,
+        Position.INTERMEDIARY,
+        Position.FINAL,
+    ]
+    section_index = 0
+
+    # Single pass over the file, sections being separated by lines starting with '#'
     with open(graph_file, "r") as file:
-        sections = list(
-            map(
-                lambda section: list(
-                    map(
-                        lambda line: list(
-                            map(lambda piece: piece.strip(), line.split(":"))
-                        ),
-                        filter(lambda line: line, section.split("\n")),
-                    )
-                ),
-                file.read().split("#"),
+        for line in file:
+            line = line.strip()
+
+            if not line:
+                continue
+
+            if line.startswith("#"):
+                section_index += 1
+                continue
+
+            pieces = [piece.strip() for piece in line.split(":")]
+            message_id = int(pieces[0])
+
+            # Endpoint names are interned so all messages share one string object per endpoint,
+            # letting matching origin/destination comparisons resolve on identity.
+            library[message_id] = Message(
+                message_id,
+                sys.intern(pieces[1]),
+                sys.intern(pieces[2]),
+                pieces[3],
+                parse_direction(pieces[4]),
+                section_positions[section_index],
             )
-        )
-
-        section_positions: list[Position] = [
-            Position.INITIAL,
-            Position.INTERMEDIARY,
-            Position.FINAL,
-        ]
-
-        for section_index, section in enumerate(sections):
-            for message in section:
-                library[int(message[0])] = Message(
-                    int(message[0]),
-                    message[1],
-                    message[2],
-                    message[3],
-                    parse_direction(message[4]),
-                    section_positions[section_index],
-                )
 
     graph: dict[int, set[int]] = {}
 
     for message_id in library:
         graph[message_id] = set()
 
-    build_relationships(graph, library)
+    build_relationships(graph, library, same_operation)
+
+    # The relationships don't change anymore, so each message's neighbors are frozen into a
+    # sorted tuple: cheaper to iterate than a set and enumerated in a deterministic order.
+    frozen_graph: dict[int, tuple[int, ...]] = {
+        message_id: tuple(sorted(neighbors)) for message_id, neighbors in graph.items()
+    }
+
+    return (library, frozen_graph)
+
+
+def find_initial_ids(library: dict[int, Message]) -> list[int]:
+    """Lists the ids of all INITIAL messages in a library, in library order
+
+    Args:
+        library (dict[int, Message]): Message library
+
+    Returns:
+        list[int]: Ids of the INITIAL messages
+    """
 
-    return (library, graph)
+    return [
+        message_id
+        for message_id, message in library.items()
+        if message.position == Position.INITIAL
+    ]
 
 
 def generate_all_sequences(
-    library: dict[int, Message], graph: dict[int, set[int]], max_depth: int
+    library: dict[int, Message],
+    graph: dict[int, Collection[int]],
+    max_depth: int,
+    initial_ids: list[int] | None = None,
 ) -> list[list[int]]:
     """Generates all possible sequences given a causality graph
 
     Args:
         library (dict[int, Message]): Message library
-        graph (dict[int, set[int]]): Prebuilt causality graph
+        graph (dict[int, Collection[int]]): Prebuilt causality graph
         max_depth (int): Maximum depth of any given sequence
+        initial_ids (list[int], optional): Precomputed find_initial_ids of the library, worth passing when generating for several max depths. Computed if not provided.
 
     Returns:
         list[list[int]]: Resulting sequences
     """
 
+    search = prepare_search(library, graph, max_depth, initial_ids)
     sequences: list[list[int]] = []
 
-    for message_id in library:
-        if library[message_id].position == Position.INITIAL:
-            sequences += build_sequences(message_id, max_depth, graph, library)
+    for message_id in search.initial_ids:
+        sequences += walk_sequences(message_id, search)
 
     return sequences
+
+
+def count_sequences(
+    library: dict[int, Message],
+    graph: dict[int, Collection[int]],
+    max_depth: int,
+    initial_ids: list[int] | None = None,
+) -> int:
+    """Counts all possible sequences given a causality graph without generating them. Same result as len(generate_all_sequences(...)), several times faster.
+
+    Args:
+        library (dict[int, Message]): Message library
+        graph (dict[int, Collection[int]]): Prebuilt causality graph
+        max_depth (int): Maximum depth of any given sequence
+        initial_ids (list[int], optional): Precomputed find_initial_ids of the library. Computed if not provided.
+
+    Returns:
+        int: Number of sequences
+    """
+
+    search = prepare_search(library, graph, max_depth, initial_ids)
+    successors = search.successors
+    reachable = search.reachable
+    finals = reachable[0]
+
+    if max_depth < 1:
+        return 0
+
+    starting_indices = [search.indices[message_id] for message_id in search.initial_ids]
+
+    if max_depth == 1:
+        # Only sequences made of a single FINAL message fit
+        return sum(bool(finals & (1 << index)) for index in starting_indices)
+
+    descendants = build_descendants(successors)
+
+    # Number of ways to complete a sequence from a message, keyed by (message index, messages left).
+    # Only valid when nothing the message leads to is already in the sequence,
+    # since the count then doesn't depend on how the sequence got there.
+    counts: dict[tuple[int, int], int] = {}
+
+    def count_from(index: int, left: int, visited: int) -> int:
+        total = 0
+        remaining = successors[index] & reachable[left - 1] & ~visited
+
+        while remaining:
+            lowest = remaining & -remaining
+            remaining ^= lowest
+            next_index = lowest.bit_length() - 1
+
+            if finals & lowest:
+                total += 1
+            elif descendants[next_index] & (visited | lowest):
+                total += count_from(next_index, left - 1, visited | lowest)
+            else:
+                key = (next_index, left - 1)
+
+                if key not in counts:
+                    counts[key] = count_from(next_index, left - 1, lowest)
+
+                total += counts[key]
+
+        return total
+
+    total = 0
+
+    for index in starting_indices:
+        if finals & (1 << index):
+            total += 1
+        else:
+            total += count_from(index, max_depth - 1, 1 << index)
+
+    return total
+
+
+def generate_packed_sequences(
+    library: dict[int, Message],
+    graph: dict[int, Collection[int]],
+    max_depth: int,
+    initial_ids: list[int] | None = None,
+) -> tuple[array, array]:
+    """Generates all possible sequences given a causality graph, packed back to back in a single flat array of message ids rather than as a list of lists. Same sequences, in the same order, as generate_all_sequences, for a fraction of the memory.
+
+    Args:
+        library (dict[int, Message]): Message library
+        graph (dict[int, Collection[int]]): Prebuilt causality graph
+        max_depth (int): Maximum depth of any given sequence
+        initial_ids (list[int], optional): Precomputed find_initial_ids of the library. Computed if not provided.
+
+    Returns:
+        tuple[array, array]: buffer, offsets. Sequence n is buffer[offsets[n]:offsets[n + 1]]
+    """
+
+    search = prepare_search(library, graph, max_depth, initial_ids)
+    buffer = array("q")
+    offsets = array("q", [0])
+
+    for message_id in search.initial_ids:
+        for sequence in walk_sequences(message_id, search):
+            buffer.extend(sequence)
+            offsets.append(len(buffer))
+
+    return (buffer, offsets)
+
+
+def unpack_sequences(buffer: array, offsets: array) -> Iterator[memoryview]:
+    """Iterates over sequences packed by generate_packed_sequences without copying them. Each sequence is a read-only view into the buffer which can be passed to project_sequences or pair_filter as is.
+
+    Args:
+        buffer (array): Packed message ids
+        offsets (array): Start of each sequence in the buffer, followed by the end of the last one
+
+    Yields:
+        memoryview: Each message sequence
+    """
+
+    view = memoryview(buffer).toreadonly()
+
+    for start, end in pairwise(offsets):
+        yield view[start:end]
+
+
+def generate_projected_sequences(
+    library: dict[int, Message],
+    graph: dict[int, Collection[int]],
+    max_depth: int,
+    whitelist: set[int],
+    initial_ids: list[int] | None = None,
+) -> list[list[int]]:
+    """Generates all possible sequences given a causality graph, directly projected for a given whitelist of message ids. Same results as project_sequences over generate_all_sequences, without ever holding all the full sequences.
+
+    Args:
+        library (dict[int, Message]): Message library
+        graph (dict[int, Collection[int]]): Prebuilt causality graph
+        max_depth (int): Maximum depth of any given sequence
+        whitelist (set[int]): Whitelist of message ids to project for
+        initial_ids (list[int], optional): Precomputed find_initial_ids of the library. Computed if not provided.
+
+    Returns:
+        list[list[int]]: Resulting filtered/projected sequences
+    """
+
+    search = prepare_search(library, graph, max_depth, initial_ids)
+
+    return project_sequences(
+        chain.from_iterable(
+            walk_sequences(message_id, search) for message_id in search.initial_ids
+        ),
+        whitelist,
+    )
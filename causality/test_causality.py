@@ -0,0 +1,147 @@
+# test_causality.py
+# Regression checks for the causality graph and the sequence generation entry points.
+# Run with: python -m unittest test_causality
+
+import os
+import unittest
+
+from causality import (
+    Direction,
+    Message,
+    Position,
+    build_descendants,
+    build_graph,
+    count_sequences,
+    generate_all_sequences,
+    generate_packed_sequences,
+    generate_projected_sequences,
+    project_sequences,
+    unpack_sequences,
+)
+
+
+def make_message(id: int, position: Position) -> Message:
+    """Builds a placeholder message, only its id and position matter to the graphs below"""
+
+    return Message(id, "", "", "", Direction.REQ, position)
+
+
+def make_cyclic_graph() -> tuple[dict[int, Message], dict[int, tuple[int, ...]]]:
+    """Builds a small library and graph where 2 -> 3 -> 4 -> 2 is a cycle, reachable both from 1 and from 7, with FINAL exits at 5 and 6"""
+
+    library = {
+        1: make_message(1, Position.INITIAL),
+        7: make_message(7, Position.INITIAL),
+        2: make_message(2, Position.INTERMEDIARY),
+        3: make_message(3, Position.INTERMEDIARY),
+        4: make_message(4, Position.INTERMEDIARY),
+        8: make_message(8, Position.INTERMEDIARY),
+        5: make_message(5, Position.FINAL),
+        6: make_message(6, Position.FINAL),
+    }
+    graph = {
+        1: (2, 8),
+        7: (3, 8),
+        2: (3, 6),
+        3: (4, 5),
+        4: (2, 6),
+        8: (2, 6),
+        5: (),
+        6: (),
+    }
+
+    return (library, graph)
+
+
+class CountSequencesTest(unittest.TestCase):
+    def test_cyclic_graph(self):
+        library, graph = make_cyclic_graph()
+
+        for max_depth in range(0, 9):
+            with self.subTest(max_depth=max_depth):
+                self.assertEqual(
+                    count_sequences(library, graph, max_depth),
+                    len(generate_all_sequences(library, graph, max_depth)),
+                )
+
+    def test_causality_txt(self):
+        library, graph = build_graph(
+            os.path.join(os.path.dirname(__file__), "causality.txt")
+        )
+
+        for max_depth in range(0, 8):
+            with self.subTest(max_depth=max_depth):
+                self.assertEqual(
+                    count_sequences(library, graph, max_depth),
+                    len(generate_all_sequences(library, graph, max_depth)),
+                )
+
+
+class GeneratePackedSequencesTest(unittest.TestCase):
+    def test_cyclic_graph(self):
+        library, graph = make_cyclic_graph()
+
+        for max_depth in range(0, 9):
+            with self.subTest(max_depth=max_depth):
+                buffer, offsets = generate_packed_sequences(library, graph, max_depth)
+
+                self.assertEqual(
+                    [list(sequence) for sequence in unpack_sequences(buffer, offsets)],
+                    generate_all_sequences(library, graph, max_depth),
+                )
+
+
+class GenerateProjectedSequencesTest(unittest.TestCase):
+    def test_cyclic_graph(self):
+        library, graph = make_cyclic_graph()
+
+        for whitelist in ({1, 2, 5, 6}, {3, 4, 8}, {7, 6}):
+            for max_depth in range(0, 9):
+                with self.subTest(whitelist=whitelist, max_depth=max_depth):
+                    self.assertEqual(
+                        generate_projected_sequences(
+                            library, graph, max_depth, whitelist
+                        ),
+                        project_sequences(
+                            generate_all_sequences(library, graph, max_depth),
+                            whitelist,
+                        ),
+                    )
+
+
+class BuildGraphTest(unittest.TestCase):
+    def test_same_operation(self):
+        graph_file = os.path.join(os.path.dirname(__file__), "causality.txt")
+        library, graph = build_graph(graph_file)
+        _, same_operation_graph = build_graph(graph_file, same_operation=True)
+
+        # The opcode rule only ever removes relationships, those between messages of different opcodes
+        expected = {
+            message_id: tuple(
+                neighbor_id
+                for neighbor_id in neighbors
+                if library[neighbor_id].operation == library[message_id].operation
+            )
+            for message_id, neighbors in graph.items()
+        }
+
+        self.assertEqual(same_operation_graph, expected)
+        self.assertLess(
+            sum(map(len, same_operation_graph.values())),
+            sum(map(len, graph.values())),
+        )
+
+
+class BuildDescendantsTest(unittest.TestCase):
+    def test_cycles_and_chains(self):
+        # 0 -> 1 -> 2 -> 1 and 2 -> 3, 4 on its own with a self loop
+        successors = [0b00010, 0b00100, 0b01010, 0b00000, 0b10000]
+
+        self.assertEqual(
+            build_descendants(successors),
+            [0b01110, 0b01110, 0b01110, 0b00000, 0b10000],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()